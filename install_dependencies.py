@@ -10,18 +10,107 @@ import subprocess
 import platform
 import json
 import shutil
+import shlex
+import re
+import io
+from contextlib import redirect_stdout, redirect_stderr
 from pathlib import Path
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Tuple, Union
 import urllib.request
 import zipfile
 import tarfile
+import tempfile
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+try:
+    import importlib.metadata as importlib_metadata
+except ImportError:  # Python 3.7
+    importlib_metadata = None
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# major.minor[.patch] anywhere in a version string
+_VER_RE = re.compile(r'(\d+)\.(\d+)(?:\.(\d+))?')
+
+def parse_version(text: str) -> Optional[Tuple[int, int, int]]:
+    """Extract the first version number from text as a comparable tuple."""
+    m = _VER_RE.search(text)
+    if m is None:
+        return None
+    return tuple(int(x) for x in m.groups(default='0'))
+
+# ESP-IDF tools.json platform names, by (system, machine)
+IDF_TOOLS_PLATFORMS = {
+    ('linux', 'x86_64'): 'linux-amd64',
+    ('linux', 'amd64'): 'linux-amd64',
+    ('linux', 'aarch64'): 'linux-arm64',
+    ('linux', 'arm64'): 'linux-arm64',
+    ('linux', 'armv7l'): 'linux-armhf',
+    ('linux', 'i686'): 'linux-i686',
+    ('darwin', 'x86_64'): 'macos',
+    ('darwin', 'arm64'): 'macos-arm64'
+}
+
+# Install commands per package manager; {pkgs} is the space-separated package list
+PM_CMDS = {
+    'apt': ['sudo apt-get update', 'sudo apt-get install -y {pkgs}'],
+    'dnf': ['sudo dnf install -y {pkgs}'],
+    'pacman': ['sudo pacman -S --needed --noconfirm {pkgs}'],
+    'zypper': ['sudo zypper --non-interactive install {pkgs}'],
+    'brew': ['brew install {pkgs}']
+}
+
+# Package names per package manager, where they differ from the tool name
+PM_PACKAGES = {
+    'apt': {'git': 'git', 'cmake': 'cmake', 'ninja': 'ninja-build'},
+    'dnf': {'git': 'git', 'cmake': 'cmake', 'ninja': 'ninja-build'},
+    'pacman': {'git': 'git', 'cmake': 'cmake', 'ninja': 'ninja'},
+    'zypper': {'git': 'git', 'cmake': 'cmake', 'ninja': 'ninja'},
+    'brew': {'git': 'git', 'cmake': 'cmake', 'ninja': 'ninja'}
+}
+
+# os-release IDs (ID and ID_LIKE) mapped to their package manager
+OS_RELEASE_PMS = {
+    'debian': 'apt', 'ubuntu': 'apt',
+    'fedora': 'dnf', 'rhel': 'dnf', 'centos': 'dnf',
+    'arch': 'pacman',
+    'suse': 'zypper', 'opensuse': 'zypper'
+}
 
 class DependencyInstaller:
     def __init__(self):
         self.project_root = Path.cwd()
+        self.home = Path.home()
         self.esp_idf_path = None
         self.system = platform.system().lower()
         self.arch = platform.machine().lower()
+        self._pm = self.detect_package_manager()
+        
+        # Common ESP-IDF installation paths
+        self._esp_search_paths = (
+            self.home / "esp" / "esp-idf",
+            self.home / "esp" / "v5.5" / "esp-idf",
+            Path("/opt/esp/esp-idf"),
+            Path("/usr/local/esp/esp-idf")
+        )
+        
+        # PATH lookups and version probes, cached for the installer session
+        self._which_cache: Dict[str, Optional[str]] = {}
+        self._tool_versions: Dict[str, Tuple[bool, Optional[str]]] = {}
+        
+        # Shared HTTP session, created on first download (requests may be
+        # installed by this very run)
+        self._http = None
+        
+        # Guards the output buffer; prefetch workers flush it via download_file
+        self._print_lock = threading.Lock()
+        
+        # Console output is buffered and written out once per section, and
+        # before anything that may block for a while
+        self._buf = io.StringIO()
         
         # Colors for output
         self.colors = {
@@ -36,6 +125,16 @@ class DependencyInstaller:
             'end': '\033[0m'
         }
         
+        # (prefix, suffix) per (color, bold); plain text when not on a terminal
+        if sys.stdout.isatty():
+            self._fmt = {
+                (color, bold): ((self.colors['bold'] if bold else '') + code, self.colors['end'])
+                for color, code in self.colors.items()
+                for bold in (True, False)
+            }
+        else:
+            self._fmt = {}
+        
         # Dependencies to check and install
         self.dependencies = {
             'system': {
@@ -63,14 +162,56 @@ class DependencyInstaller:
             }
         }
 
+    def detect_package_manager(self) -> Optional[str]:
+        """Pick the system package manager from the platform and /etc/os-release."""
+        if self.system == 'darwin':
+            return 'brew'
+        if self.system != 'linux':
+            return None
+        
+        try:
+            os_release = platform.freedesktop_os_release()
+        except AttributeError:  # Python < 3.10
+            os_release = {}
+            try:
+                with open('/etc/os-release') as f:
+                    for line in f:
+                        key, sep, value = line.strip().partition('=')
+                        if sep:
+                            os_release[key] = value.strip('"\'')
+            except OSError:
+                pass
+        except OSError:
+            os_release = {}
+        
+        ids = [os_release.get('ID', '')] + os_release.get('ID_LIKE', '').split()
+        for os_id in ids:
+            if os_id in OS_RELEASE_PMS:
+                return OS_RELEASE_PMS[os_id]
+        return None
+
     def print_colored(self, text: str, color: str = 'white', bold: bool = False):
         """Print colored text to console."""
-        color_code = self.colors.get(color, '')
-        bold_code = self.colors.get('bold', '') if bold else ''
-        print(f"{bold_code}{color_code}{text}{self.colors['end']}")
+        pre, suf = self._fmt.get((color, bold), ('', ''))
+        with self._print_lock:
+            self._buf.write(pre)
+            self._buf.write(text)
+            self._buf.write(suf)
+            self._buf.write('\n')
+
+    def _flush(self):
+        """Write buffered console output to stdout."""
+        with self._print_lock:
+            text = self._buf.getvalue()
+            if text:
+                sys.stdout.write(text)
+                self._buf.seek(0)
+                self._buf.truncate()
+            sys.stdout.flush()
 
     def print_header(self, text: str):
         """Print a header with formatting."""
+        self._flush()
         self.print_colored(f"\n{'='*60}", 'cyan', bold=True)
         self.print_colored(f"  {text}", 'cyan', bold=True)
         self.print_colored(f"{'='*60}", 'cyan', bold=True)
@@ -91,32 +232,167 @@ class DependencyInstaller:
         """Print error message."""
         self.print_colored(f"❌ {text}", 'red')
 
-    def run_command(self, cmd: str, capture_output: bool = True, check: bool = True) -> Tuple[int, str, str]:
-        """Run a shell command and return result."""
+    def run_command(self, cmd: Union[str, List[str]], capture_output: bool = True, check: bool = True,
+                    cwd: Optional[Union[str, Path]] = None, stream: bool = False) -> Tuple[int, str, str]:
+        """Run a command without a shell and return result.
+        
+        With stream=True the child writes straight to the terminal, so long
+        installers show live progress and stdout/stderr come back empty.
+        """
+        args = shlex.split(cmd) if isinstance(cmd, str) else list(cmd)
+        self._flush()
         try:
             result = subprocess.run(
-                cmd, 
-                shell=True, 
-                capture_output=capture_output, 
+                args, 
+                shell=False, 
+                capture_output=capture_output and not stream, 
                 text=True,
-                check=check
+                check=check,
+                cwd=cwd
             )
-            return result.returncode, result.stdout, result.stderr
+            return result.returncode, result.stdout or "", result.stderr or ""
         except subprocess.CalledProcessError as e:
-            return e.returncode, e.stdout, e.stderr
+            return e.returncode, e.stdout or "", e.stderr or ""
+        except OSError as e:
+            return 127, "", str(e)
+
+    def _pip_install(self, pkgs: List[str]) -> Tuple[int, str, str]:
+        """Install packages with pip, in-process when pip is importable."""
+        self._flush()
+        try:
+            from pip._internal.cli.main import main as pip_main
+        except ImportError:
+            return self.run_command([sys.executable, "-m", "pip", "install", *pkgs], check=False)
+        
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            try:
+                returncode = pip_main(["install", *pkgs])
+            except SystemExit as e:
+                returncode = 0 if e.code is None else (e.code if isinstance(e.code, int) else 1)
+        return returncode, stdout.getvalue(), stderr.getvalue()
 
     def check_command_exists(self, cmd: str) -> bool:
         """Check if a command exists in PATH."""
-        return shutil.which(cmd.split()[0]) is not None
+        key = cmd.split()[0]
+        if key not in self._which_cache:
+            self._which_cache[key] = shutil.which(key)
+        return self._which_cache[key] is not None
+
+    def _forget_tool(self, tool: str) -> None:
+        """Drop cached lookups for a tool after it has been (re)installed."""
+        self._which_cache.pop(tool, None)
+        self._tool_versions.pop(tool, None)
+
+    def _tool_version(self, tool: str) -> Tuple[bool, Optional[str]]:
+        """Return (exists, version string) for a tool, looking it up at most once.
+        
+        Never runs the tool; the version is None unless it can be read from disk.
+        """
+        if tool not in self._tool_versions:
+            version = None
+            exists = self.check_command_exists(tool)
+            if exists:
+                version = self._read_tool_version(tool)
+            self._tool_versions[tool] = (exists, version)
+        return self._tool_versions[tool]
+
+    def _read_tool_version(self, tool: str) -> Optional[str]:
+        """Read a tool's version from its source tree, without exec."""
+        if tool == 'idf.py':
+            idf_py = self._which_cache.get(tool)
+            if not idf_py:
+                return None
+            # <IDF_PATH>/tools/idf.py -> <IDF_PATH>/components/esp_common/include/esp_idf_version.h
+            header = Path(idf_py).resolve().parent.parent / "components" / "esp_common" / "include" / "esp_idf_version.h"
+            try:
+                text = header.read_text()
+            except OSError:
+                return None
+            parts = dict(re.findall(r'#define\s+ESP_IDF_VERSION_(MAJOR|MINOR|PATCH)\s+(\d+)', text))
+            if len(parts) == 3:
+                return f"ESP-IDF v{parts['MAJOR']}.{parts['MINOR']}.{parts['PATCH']}"
+        
+        return None
+
+    def _http_session(self):
+        """Return a pooled, retrying requests.Session, or None without requests."""
+        if self._http is None:
+            try:
+                import requests
+                from requests.adapters import HTTPAdapter
+                from urllib3.util.retry import Retry
+            except ImportError:
+                return None
+            self._http = requests.Session()
+            self._http.mount("https://", HTTPAdapter(
+                pool_maxsize=4,
+                max_retries=Retry(total=3, backoff_factor=0.5)
+            ))
+        return self._http
+
+    def download_file(self, url: str, dest) -> None:
+        """Stream a URL into an open binary file object."""
+        self._flush()
+        session = self._http_session()
+        if session is None:
+            with urllib.request.urlopen(url, timeout=30) as response:
+                shutil.copyfileobj(response, dest, 1 << 20)
+            return
+        with session.get(url, stream=True, timeout=30) as r:
+            r.raise_for_status()
+            for chunk in r.iter_content(1 << 20):
+                dest.write(chunk)
+
+    def extract_zip(self, zip_ref: zipfile.ZipFile, dest: Path) -> None:
+        """Extract an archive, decompressing members on a thread pool.
+        
+        ZipFile's open/close bookkeeping is not thread-safe, so those calls
+        are serialized; reads go through ZipFile's own shared-handle lock, and
+        zlib releases the GIL while inflating, so members decompress in
+        parallel. Parent directories are created up front so workers never
+        race on makedirs.
+        """
+        self._flush()
+        # Plain strings avoid building a PurePath per member in the loops below
+        dest_s = os.fspath(dest)
+        created = set()
+        files = []
+        for member in zip_ref.infolist():
+            if member.is_dir():
+                zip_ref.extract(member, dest_s)
+                continue
+            # Same sanitizing as ZipFile.extract: drop empty, '.' and '..' parts
+            parts = [p for p in member.filename.split('/') if p not in ('', '.', '..')]
+            parent = os.path.join(dest_s, *parts[:-1])
+            if parent not in created:
+                os.makedirs(parent, exist_ok=True)
+                created.add(parent)
+            files.append((member, os.path.join(parent, parts[-1])))
+        
+        open_lock = threading.Lock()
+        
+        def extract_one(member: zipfile.ZipInfo, target: str) -> None:
+            with open_lock:
+                source = zip_ref.open(member)
+            try:
+                with open(target, 'wb') as f:
+                    shutil.copyfileobj(source, f, 1 << 20)
+            finally:
+                with open_lock:
+                    source.close()
+        
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as ex:
+            # list() re-raises the first extraction error, if any
+            list(ex.map(lambda item: extract_one(*item), files))
 
     def check_python_version(self) -> bool:
         """Check if Python version meets requirements."""
-        try:
-            version = sys.version_info
-            required = tuple(map(int, self.dependencies['system']['python']['min_version'].split('.')))
-            return version >= required
-        except Exception:
+        current = parse_version(sys.version)
+        required = parse_version(self.dependencies['system']['python']['min_version'])
+        if current is None or required is None:
             return False
+        return current >= required
 
     def install_system_dependencies(self) -> bool:
         """Install system-level dependencies."""
@@ -126,23 +402,10 @@ class DependencyInstaller:
         if not self.check_python_version():
             self.print_error(f"Python {self.dependencies['system']['python']['min_version']}+ required")
             return False
-        self.print_success(f"Python {sys.version.split()[0]} detected")
-
-        # Check and install system tools
-        system_tools = {
-            'macos': {
-                'git': 'brew install git',
-                'cmake': 'brew install cmake',
-                'ninja': 'brew install ninja'
-            },
-            'linux': {
-                'git': 'sudo apt-get update && sudo apt-get install -y git',
-                'cmake': 'sudo apt-get install -y cmake',
-                'ninja': 'sudo apt-get install -y ninja-build'
-            }
-        }
+        self.print_success(f"Python {'.'.join(map(str, parse_version(sys.version)))} detected")
 
-        for tool, check_cmd in self.dependencies['system'].items():
+        missing = []
+        for tool in self.dependencies['system']:
             if tool == 'python':
                 continue
                 
@@ -151,18 +414,33 @@ class DependencyInstaller:
                 self.print_success(f"{tool} already installed")
             else:
                 self.print_warning(f"{tool} not found")
-                if self.system in system_tools and tool in system_tools[self.system]:
-                    install_cmd = system_tools[self.system][tool]
-                    self.print_step(f"Installing {tool}...")
-                    returncode, stdout, stderr = self.run_command(install_cmd, check=False)
-                    if returncode == 0:
-                        self.print_success(f"{tool} installed successfully")
-                    else:
-                        self.print_error(f"Failed to install {tool}: {stderr}")
-                        return False
-                else:
-                    self.print_error(f"Please install {tool} manually")
-                    return False
+                missing.append(tool)
+
+        if not missing:
+            return True
+
+        packages = PM_PACKAGES.get(self._pm, {})
+        manual = [tool for tool in missing if tool not in packages]
+        if manual:
+            for tool in manual:
+                self.print_error(f"Please install {tool} manually")
+            return False
+
+        pkgs = " ".join(shlex.quote(packages[tool]) for tool in missing)
+        self.print_step(f"Installing {', '.join(missing)}...")
+        for install_cmd in PM_CMDS[self._pm]:
+            returncode, stdout, stderr = self.run_command(install_cmd.format(pkgs=pkgs), check=False)
+            if returncode != 0:
+                self.print_error(f"Failed to install {', '.join(missing)}: {stderr}")
+                return False
+
+        for tool in missing:
+            self._forget_tool(tool)
+            if self.check_command_exists(tool):
+                self.print_success(f"{tool} installed successfully")
+            else:
+                self.print_error(f"Failed to install {tool}")
+                return False
 
         return True
 
@@ -170,35 +448,95 @@ class DependencyInstaller:
         """Install Python packages."""
         self.print_header("Installing Python Packages")
         
-        for package in self.dependencies['python_packages']:
-            self.print_step(f"Installing {package}...")
-            returncode, stdout, stderr = self.run_command(f"pip3 install {package}", check=False)
-            if returncode == 0:
+        packages = self.dependencies['python_packages']
+        missing = []
+        for package in packages:
+            if self._is_installed(package):
+                self.print_success(f"{package} already installed")
+            else:
+                missing.append(package)
+        if not missing:
+            return True
+        
+        self.print_step(f"Installing {', '.join(missing)}...")
+        # One pip run resolves and downloads everything in a single pass
+        returncode, stdout, stderr = self._pip_install(missing)
+        
+        installed, failed = self.parse_pip_output(missing, stdout + stderr)
+        unresolved = []
+        for package in missing:
+            if package in failed:
+                self.print_warning(f"Failed to install {package}: {failed[package]}")
+            elif package in installed or returncode == 0:
                 self.print_success(f"{package} installed successfully")
             else:
-                self.print_warning(f"Failed to install {package}: {stderr}")
-                # Continue with other packages
+                unresolved.append(package)
+        
+        if unresolved:
+            # pip's stderr covers the whole batch, so show it once
+            if stderr.strip():
+                self.print_warning(f"pip reported: {stderr.strip()}")
+            self.print_warning(f"Failed to install {', '.join(unresolved)}")
+            # Continue with the rest of the installation
 
         return True
 
+    def _is_installed(self, package: str) -> bool:
+        """Check installed distribution metadata without invoking pip."""
+        if importlib_metadata is None:
+            return False
+        try:
+            importlib_metadata.version(package)
+            return True
+        except importlib_metadata.PackageNotFoundError:
+            return False
+
+    def parse_pip_output(self, packages: List[str], output: str) -> Tuple[List[str], Dict[str, str]]:
+        """Split combined pip output into installed and failed packages."""
+        def normalize(name: str) -> str:
+            return re.sub(r'[-_.]+', '-', name).lower()
+        
+        wanted = {normalize(p): p for p in packages}
+        installed = []
+        failed = {}
+        for line in output.splitlines():
+            line = line.strip()
+            if line.startswith("Successfully installed"):
+                for dist in line.split()[2:]:
+                    name = normalize(dist.rsplit('-', 1)[0])
+                    if name in wanted:
+                        installed.append(wanted[name])
+            elif line.startswith("Requirement already satisfied:"):
+                name = normalize(line.split(':', 1)[1].split()[0])
+                if name in wanted:
+                    installed.append(wanted[name])
+            elif line.startswith("ERROR:"):
+                # Whole requirement tokens only, e.g. "nopkg" or "nopkg==1.0"
+                for token in re.split(r'[\s(),;:\'"]+', line):
+                    name = normalize(re.split(r'[<>=!~\[]', token, 1)[0])
+                    if name in wanted:
+                        failed.setdefault(wanted[name], line)
+        return installed, failed
+
     def check_esp_idf_installation(self) -> bool:
         """Check if ESP-IDF is installed."""
         self.print_header("Checking ESP-IDF Installation")
         
+        # An exported IDF_PATH is authoritative and needs a single stat
+        idf_env = os.environ.get('IDF_PATH')
+        if idf_env and Path(idf_env, 'tools', 'idf.py').exists():
+            self.print_success(f"ESP-IDF found at {idf_env} (IDF_PATH)")
+            self.esp_idf_path = Path(idf_env)
+            return True
+        
         # Check if idf.py is available
-        if self.check_command_exists('idf.py'):
-            self.print_success("ESP-IDF found in PATH")
+        exists, version = self._tool_version('idf.py')
+        if exists:
+            self.print_success(f"ESP-IDF found in PATH ({version})" if version else "ESP-IDF found in PATH")
             return True
             
         # Check common installation paths
-        common_paths = [
-            Path.home() / "esp" / "esp-idf",
-            Path.home() / "esp" / "v5.5" / "esp-idf",
-            Path("/opt/esp/esp-idf"),
-            Path("/usr/local/esp/esp-idf")
-        ]
-        
-        for path in common_paths:
+        for path in self._esp_search_paths:
             if path.exists():
                 self.print_success(f"ESP-IDF found at {path}")
                 self.esp_idf_path = path
@@ -211,46 +549,37 @@ class DependencyInstaller:
         """Install ESP-IDF."""
         self.print_header("Installing ESP-IDF")
         
-        esp_dir = Path.home() / "esp"
+        esp_dir = self.home / "esp"
         esp_dir.mkdir(exist_ok=True)
         
         # Download and install ESP-IDF
         idf_version = self.dependencies['esp_idf']['esp-idf']['version']
-        idf_url = f"https://github.com/espressif/esp-idf/archive/refs/tags/{idf_version}.zip"
-        idf_path = esp_dir / "esp-idf"
+        idf_path_s = os.path.join(os.fspath(esp_dir), "esp-idf")
+        idf_path = Path(idf_path_s)
         
         self.print_step(f"Downloading ESP-IDF {idf_version}...")
         
         try:
-            # Download ESP-IDF
-            zip_path = esp_dir / f"esp-idf-{idf_version}.zip"
-            urllib.request.urlretrieve(idf_url, zip_path)
-            
-            # Extract
-            self.print_step("Extracting ESP-IDF...")
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                zip_ref.extractall(esp_dir)
-            
-            # Rename if needed
-            extracted_path = esp_dir / f"esp-idf-{idf_version}"
-            if extracted_path.exists() and not idf_path.exists():
-                extracted_path.rename(idf_path)
-            
-            # Clean up
-            zip_path.unlink()
+            if self.clone_esp_idf(idf_version, idf_path_s):
+                self.print_success("ESP-IDF cloned successfully")
+            else:
+                self.print_warning("git clone failed, falling back to the release archive")
+                self.download_esp_idf_archive(idf_version, esp_dir, idf_path)
+                self.print_success("ESP-IDF downloaded successfully")
             
-            self.print_success("ESP-IDF downloaded successfully")
+            # Pre-populate install.sh's download cache in parallel
+            self.prefetch_esp_idf_tools(idf_path)
             
             # Install ESP-IDF tools
             self.print_step("Installing ESP-IDF tools...")
             install_script = idf_path / "install.sh"
             if install_script.exists():
-                returncode, stdout, stderr = self.run_command(f"cd {idf_path} && ./install.sh esp32", check=False)
+                returncode, stdout, stderr = self.run_command(["./install.sh", "esp32"], check=False, cwd=idf_path, stream=True)
                 if returncode == 0:
                     self.print_success("ESP-IDF tools installed successfully")
                     return True
                 else:
-                    self.print_error(f"Failed to install ESP-IDF tools: {stderr}")
+                    self.print_error(f"Failed to install ESP-IDF tools (exit code {returncode})")
                     return False
             else:
                 self.print_error("ESP-IDF install script not found")
@@ -260,12 +589,129 @@ class DependencyInstaller:
             self.print_error(f"Failed to download/install ESP-IDF: {e}")
             return False
 
+    def clone_esp_idf(self, idf_version: str, idf_path: str) -> bool:
+        """Shallow-clone ESP-IDF with submodules.
+        
+        A failed clone is removed, so the archive fallback starts from a clean
+        directory instead of extracting next to a half-populated checkout.
+        A directory that existed before the clone is never touched.
+        """
+        existed = os.path.exists(idf_path)
+        returncode, stdout, stderr = self.run_command(
+            ["git", "clone", "--depth", "1", "--branch", idf_version,
+             "--recurse-submodules", "--shallow-submodules",
+             "https://github.com/espressif/esp-idf.git", idf_path],
+            check=False, stream=True
+        )
+        if returncode != 0:
+            if not existed:
+                shutil.rmtree(idf_path, ignore_errors=True)
+            return False
+        return True
+
+    def download_esp_idf_archive(self, idf_version: str, esp_dir: Path, idf_path: Path) -> None:
+        """Download and extract the ESP-IDF release archive (no git metadata)."""
+        idf_url = f"https://github.com/espressif/esp-idf/archive/refs/tags/{idf_version}.zip"
+        
+        # Download ESP-IDF into an anonymous temp file, deleted on close.
+        # (SpooledTemporaryFile lacks seekable() before 3.11, which ZipFile needs.)
+        with tempfile.TemporaryFile() as archive:
+            self.download_file(idf_url, archive)
+            archive.seek(0)
+            
+            # Extract
+            self.print_step("Extracting ESP-IDF...")
+            with zipfile.ZipFile(archive, 'r') as zip_ref:
+                self.extract_zip(zip_ref, esp_dir)
+        
+        # Rename if needed
+        extracted_path = esp_dir / f"esp-idf-{idf_version}"
+        if extracted_path.exists() and not idf_path.exists():
+            extracted_path.rename(idf_path)
+
+    def prefetch_esp_idf_tools(self, idf_path: Path) -> None:
+        """Download the toolchain archives install.sh needs, concurrently.
+        
+        Archives land in $IDF_TOOLS_PATH/dist (~/.espressif/dist by default),
+        where idf_tools.py reuses any file whose sha256 matches tools.json.
+        Failures are only warnings: install.sh downloads whatever is missing.
+        """
+        self.print_step("Downloading ESP-IDF tools...")
+        platform_key = IDF_TOOLS_PLATFORMS.get((self.system, self.arch))
+        try:
+            with open(idf_path / "tools" / "tools.json") as f:
+                tools = json.load(f).get('tools', [])
+        except (OSError, ValueError, AttributeError) as e:
+            self.print_warning(f"Skipping tool prefetch: {e}")
+            return
+        
+        try:
+            downloads = []
+            for tool in tools:
+                # idf_tools.py applies per-platform overrides (e.g. "install") first
+                for override in tool.get('platform_overrides', []):
+                    if platform_key in override.get('platforms', []):
+                        tool = {**tool, **{k: v for k, v in override.items() if k != 'platforms'}}
+                targets = tool.get('supported_targets', ['all'])
+                if tool.get('install') != 'always' or not ('all' in targets or 'esp32' in targets):
+                    continue
+                for version in tool.get('versions', []):
+                    if version.get('status') != 'recommended':
+                        continue
+                    archive = version.get(platform_key) or version.get('any')
+                    if archive and 'url' in archive:
+                        downloads.append(archive)
+            
+            dist_dir = Path(os.environ.get('IDF_TOOLS_PATH', self.home / ".espressif")) / "dist"
+            dist_dir.mkdir(parents=True, exist_ok=True)
+            
+            # Create the shared session up front so workers don't race to build it
+            self._http_session()
+            
+            # Matches the HTTPAdapter pool size, so every worker keeps its connection
+            with ThreadPoolExecutor(max_workers=4) as ex:
+                results = list(ex.map(lambda archive: self._fetch_tool_archive(archive, dist_dir), downloads))
+        except Exception as e:
+            self.print_warning(f"Tool prefetch failed, install.sh will download the tools: {e}")
+            return
+        
+        failed = [error for error in results if error]
+        for error in failed:
+            self.print_warning(error)
+        self.print_success(f"Prefetched {len(downloads) - len(failed)} of {len(downloads)} tool archives")
+
+    def _fetch_tool_archive(self, archive: Dict, dist_dir: Path) -> Optional[str]:
+        """Download one tools.json archive into dist_dir; return an error or None."""
+        url = archive['url']
+        dest = dist_dir / url.rsplit('/', 1)[-1]
+        if dest.exists() and dest.stat().st_size == archive.get('size'):
+            return None
+        
+        partial = dest.with_name(dest.name + ".part")
+        try:
+            with open(partial, 'wb') as f:
+                self.download_file(url, f)
+            if 'sha256' in archive:
+                digest = hashlib.sha256()
+                with open(partial, 'rb') as f:
+                    for chunk in iter(lambda: f.read(1 << 20), b''):
+                        digest.update(chunk)
+                if digest.hexdigest() != archive['sha256']:
+                    partial.unlink()
+                    return f"Checksum mismatch for {dest.name}"
+            partial.replace(dest)
+            return None
+        except Exception as e:
+            if partial.exists():
+                partial.unlink()
+            return f"Failed to download {dest.name}: {e}"
+
     def setup_esp_idf_environment(self) -> bool:
         """Set up ESP-IDF environment."""
         self.print_header("Setting up ESP-IDF Environment")
         
         if not self.esp_idf_path:
-            self.esp_idf_path = Path.home() / "esp" / "esp-idf"
+            self.esp_idf_path = self.home / "esp" / "esp-idf"
         
         if not self.esp_idf_path.exists():
             self.print_error("ESP-IDF path not found")
@@ -299,11 +745,11 @@ source "$IDF_PATH/export.sh"
             
         # Install managed components
         self.print_step("Installing managed components...")
-        returncode, stdout, stderr = self.run_command("idf.py reconfigure", check=False)
+        returncode, stdout, stderr = self.run_command("idf.py reconfigure", check=False, stream=True)
         if returncode == 0:
             self.print_success("Managed components installed successfully")
         else:
-            self.print_warning(f"Failed to install managed components: {stderr}")
+            self.print_warning(f"Failed to install managed components (exit code {returncode})")
             
         return True
 
@@ -326,8 +772,12 @@ source "$IDF_PATH/export.sh"
         
         # Save summary to file
         summary_file = self.project_root / "installation_summary.json"
-        with open(summary_file, 'w') as f:
-            json.dump(summary, f, indent=2)
+        if orjson is not None:
+            with open(summary_file, 'wb') as f:
+                f.write(orjson.dumps(summary, option=orjson.OPT_INDENT_2))
+        else:
+            with open(summary_file, 'w') as f:
+                json.dump(summary, f, indent=2)
             
         self.print_success("Installation summary saved to installation_summary.json")
         
@@ -374,6 +824,8 @@ source "$IDF_PATH/export.sh"
         except Exception as e:
             self.print_error(f"Installation failed: {e}")
             return False
+        finally:
+            self._flush()
 
 def main():
     """Main entry point."""
@@ -383,11 +835,13 @@ def main():
     if success:
         print("\n" + "="*60)
         installer.print_colored("🎉 All dependencies installed successfully!", 'green', bold=True)
+        installer._flush()
         print("="*60)
         sys.exit(0)
     else:
         print("\n" + "="*60)
         installer.print_colored("❌ Installation failed. Please check the errors above.", 'red', bold=True)
+        installer._flush()
         print("="*60)
         sys.exit(1)
 